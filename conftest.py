@@ -0,0 +1,142 @@
+"""
+Shared pytest fixtures
+
+Run the suite with: pytest -v
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from pathlib import Path
+import functools
+import httpx
+import asyncio
+import orjson
+from main import app, capability_cache
+
+try:
+    import uvloop
+except ImportError:  # No Windows build; uvicorn[standard] skips it there
+    uvloop = None
+
+
+@pytest.fixture(scope="session")
+def client():
+    """One TestClient for the whole run, so the app lifespan starts and stops once"""
+    # The client's portal loop serves every request; run it on uvloop like the server when available
+    with TestClient(app, backend_options={"use_uvloop": uvloop is not None}) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    """One event loop (uvloop when installed) shared by every asyncio test"""
+    loop = uvloop.new_event_loop() if uvloop is not None else asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(autouse=True)
+def clear_capability_cache():
+    """Start every test without a cached CapabilityStatement"""
+    capability_cache.clear()
+    yield
+    capability_cache.clear()
+
+
+@pytest.fixture(scope="session")
+def mock_openemr_client(client):
+    """
+    One AsyncClient over an httpx.MockTransport, shared by the whole run and closed at its end.
+    
+    Requests are answered from the returned ``{path suffix: (status, payload)}``
+    table, which mock_openemr resets for every test.
+    """
+    responses = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        for suffix, (status_code, payload) in responses.items():
+            if request.url.path.endswith(suffix):
+                return httpx.Response(status_code, json=payload)
+        return httpx.Response(404, json={"error": "not_found"})
+
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    yield mock_client, responses
+    # Closed on the TestClient's loop, where the app used it
+    client.portal.call(mock_client.aclose)
+
+
+@pytest.fixture
+def mock_openemr(monkeypatch, mock_openemr_client, mock_token_response, mock_client_registration_response):
+    """
+    Serve OpenEMR's OAuth endpoints from the shared MockTransport client.
+    
+    The app keeps using a real AsyncClient, so request building, status
+    handling and body parsing are exercised; only the network is replaced.
+    Returns the response table so a test can swap in an error response.
+    """
+    mock_client, responses = mock_openemr_client
+    responses.clear()
+    responses.update({
+        "/token": (200, mock_token_response),
+        "/registration": (200, mock_client_registration_response),
+    })
+    # monkeypatch rather than patch.object: State keeps attributes outside __dict__,
+    # which makes patch.object delete them on exit instead of restoring them
+    monkeypatch.setattr(app.state, "http", mock_client)
+    return responses
+
+
+@pytest.fixture
+def stub_openemr(monkeypatch):
+    """
+    Replace make_openemr_request with a plain coroutine function.
+    
+    Set ``"ret"`` to the value it returns (``"by_endpoint"`` overrides it per
+    upstream path) or ``"raise"`` to an exception it raises; every call's
+    method, endpoint and keyword arguments are appended to ``"calls"``.
+    """
+    state = {"ret": None, "by_endpoint": {}, "raise": None, "calls": []}
+
+    async def stub(method, endpoint, **kwargs):
+        state["calls"].append({"method": method, "endpoint": endpoint, **kwargs})
+        if state["raise"] is not None:
+            raise state["raise"]
+        return state["by_endpoint"].get(endpoint, state["ret"])
+
+    monkeypatch.setattr("main.make_openemr_request", stub)
+    return state
+
+
+# Canned OpenEMR replies, stored as JSON under fixtures/openemr and parsed once per session;
+# tests must treat them as read-only
+FIXTURES_DIR = Path(__file__).parent / "fixtures" / "openemr"
+
+
+@functools.lru_cache(maxsize=None)
+def load_fixture(name):
+    """Parse one recorded OpenEMR reply from fixtures/openemr/<name>.json (memoized; do not mutate)"""
+    return orjson.loads((FIXTURES_DIR / f"{name}.json").read_bytes())
+
+
+@pytest.fixture(scope="session")
+def mock_token_response():
+    """OAuth token response"""
+    return load_fixture("oauth_token")
+
+
+@pytest.fixture(scope="session")
+def mock_client_registration_response():
+    """OAuth client registration response"""
+    return load_fixture("oauth_registration")
+
+
+@pytest.fixture(scope="session")
+def mock_fhir_patient_response():
+    """FHIR Patient resource returned by a create"""
+    return load_fixture("fhir_patient_create")
+
+
+@pytest.fixture(scope="session")
+def mock_standard_patient_response():
+    """Standard API patient create response"""
+    return load_fixture("api_patient_create")
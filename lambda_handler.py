@@ -4,7 +4,12 @@ Mangum adapts ASGI applications (FastAPI) to work with AWS Lambda.
 """
 
 from mangum import Mangum
-from main import app
+from main import app, init_state
+
+# Shared state is created once per container, at import. Mangum runs the ASGI lifespan on
+# every invocation, which would rebuild the OpenEMR client, Redis pool and concurrency
+# limiter (and close them again) for each request, so the lifespan is left off.
+init_state(app)
 
 # Create Mangum handler - handles API Gateway HTTP API events
 handler = Mangum(app, lifespan="off")
@@ -5,17 +5,34 @@ This application provides a FastAPI interface to interact with OpenEMR's
 REST API and FHIR API endpoints.
 """
 
-from fastapi import FastAPI, HTTPException, Depends, Header, Query, Body, status
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, Header, Query, Body, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import ORJSONResponse, RedirectResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.openapi.utils import get_openapi
+from fastapi.routing import APIRoute
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional, List, Dict, Any
+from starlette.background import BackgroundTask
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Optional, List, Dict, Any, Union, AsyncIterator, Awaitable, Callable
+from contextlib import AsyncExitStack, asynccontextmanager
+import asyncio
+import functools
+import hashlib
 import httpx
+import orjson
+import redis.asyncio as redis
 import os
-from datetime import datetime, timedelta
 import secrets
+import ssl
+import time
+from collections import deque
+from types import MappingProxyType
+from urllib.parse import quote, urlencode
+from email.utils import parsedate_to_datetime
+from cachetools import TLRUCache, TTLCache
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -24,7 +41,143 @@ load_dotenv()
 # Security scheme
 security = HTTPBearer(auto_error=False)
 
+# orjson options shared by rendered responses and cached bodies, so a cache HIT is byte-identical
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+
+
+class FHIRJSONResponse(ORJSONResponse):
+    """ORJSONResponse that also accepts non-string keys and renders UTC datetimes with Z"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against one entity tag"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+class BearerTokenMiddleware:
+    """
+    Read the bearer token from the raw ASGI headers once per request and
+    keep it on ``scope["state"]``, where require_bearer picks it up without
+    a Header() parameter to validate.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            authorization = next(
+                (value.decode("latin-1") for name, value in scope["headers"] if name == b"authorization"),
+                None
+            )
+            scope.setdefault("state", {})["bearer_token"] = get_access_token(authorization)
+        await self.app(scope, receive, send)
+
+
+class ConditionalGetMiddleware:
+    """
+    Add ETag and Cache-Control to successful GET responses and answer a
+    matching If-None-Match with 304.
+    
+    Single-message bodies are tagged with a hash of their bytes; streamed
+    bodies are tagged only when OpenEMR supplied an ETag. Streamed handlers
+    forward If-None-Match, so OpenEMR's own 304 is relayed without
+    downloading the body. Tags are weak: the middleware runs inside
+    GZipMiddleware, so one tag covers every content coding of the same
+    JSON. Written as plain ASGI so streamed bodies are never buffered.
+    """
+
+    def __init__(self, app: ASGIApp, prefixes: tuple = ("/fhir/", "/api/"), cache_control: str = "private, max-age=30"):
+        self.app = app
+        self.prefixes = prefixes
+        self.cache_control = cache_control
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "GET" or not scope["path"].startswith(self.prefixes):
+            await self.app(scope, receive, send)
+            return
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        start: Optional[Message] = None
+        not_modified = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, not_modified
+            if message["type"] == "http.response.start":
+                start = message  # Held until the first body chunk shows whether it is the whole body
+                return
+            if not_modified:
+                return  # The 304 has gone out; drop the rest of the body
+            if start is None:
+                await send(message)
+                return
+            response_start, start = start, None
+            status_code = response_start["status"]
+            if status_code in (200, 304):
+                headers = MutableHeaders(scope=response_start)
+                etag = headers.get("etag")
+                if etag is None and status_code == 200 and not message.get("more_body", False):
+                    etag = '"' + hashlib.blake2b(message.get("body", b""), digest_size=16).hexdigest() + '"'
+                if etag is not None:
+                    if not etag.startswith("W/"):
+                        etag = "W/" + etag
+                    headers["ETag"] = etag
+                    headers.setdefault("Cache-Control", self.cache_control)
+                    if status_code == 200 and if_none_match and etag_matches(if_none_match, etag):
+                        not_modified = True
+                        del headers["content-length"]
+                        await send({**response_start, "status": 304})
+                        await send({"type": "http.response.body", "body": b""})
+                        return
+            await send(response_start)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def init_state(app: FastAPI) -> None:
+    """Create the per-process resources shared by every request"""
+    # A single pooled client keeps TCP/TLS connections to OpenEMR alive across requests
+    app.state.http = create_http_client()
+    app.state.limiter = AIMDLimiter(
+        max_limit=OPENEMR_MAX_CONCURRENCY,
+        latency_target=OPENEMR_LATENCY_TARGET
+    )
+    app.state.admission = app.state.limiter.admission
+    # Monotonic deadline before which no upstream request is sent (set from rate-limit headers)
+    app.state.pause_until = 0.0
+    app.state.rpm = SlidingWindowLimiter(OPENEMR_RPM_LIMIT)
+    # Optional shared response cache for idempotent GETs
+    app.state.redis = redis.from_url(REDIS_URL) if REDIS_URL else None
+
+
+async def close_state(app: FastAPI) -> None:
+    """Release the connections held by init_state"""
+    await app.state.http.aclose()
+    if app.state.redis is not None:
+        await app.state.redis.aclose()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared resources on startup and release them on shutdown"""
+    init_state(app)
+    # Build the OpenAPI schema once up front; FastAPI memoizes it on app.openapi_schema
+    app.openapi()
+    try:
+        yield
+    finally:
+        await close_state(app)
+
+
 app = FastAPI(
+    lifespan=lifespan,
+    default_response_class=FHIRJSONResponse,
     title="OpenEMR API Interface",
     description="""
     FastAPI interface for interacting with OpenEMR Electronic Health Records system.
@@ -79,18 +232,40 @@ app = FastAPI(
             "name": "Standard API",
             "description": "Standard OpenEMR REST API endpoints for native operations.",
         },
+        {
+            "name": "Admin",
+            "description": "Runtime tuning endpoints; disabled unless ADMIN_TOKEN is set.",
+        },
     ],
 )
 
+# Innermost, so CORS preflights answered by the middleware below never pay for it
+app.add_middleware(BearerTokenMiddleware)
+
 # CORS middleware
+# An explicit allowlist keeps Starlette on its static preflight path instead of echoing
+# every request's Origin back (which a wildcard combined with credentials requires)
+CORS_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",")
+    if origin.strip()
+]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Configure appropriately for production
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE"],
+    allow_headers=["Authorization", "Content-Type", "If-None-Match", "X-Admin-Token"],
+    expose_headers=["ETag", "X-Cache"],
 )
 
+# Inside GZip, so the ETag hashes the uncompressed JSON; gzip output embeds a timestamp
+app.add_middleware(ConditionalGetMiddleware)
+
+# Compress large responses (FHIR bundles) for clients that accept gzip
+# Level 5 keeps most of the ratio on repetitive FHIR JSON at well under level 9's CPU cost
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # Configuration
 OPENEMR_BASE_URL = os.getenv("OPENEMR_BASE_URL", "https://localhost:9300")
 OPENEMR_API_BASE = f"{OPENEMR_BASE_URL}/apis/default"
@@ -98,26 +273,141 @@ OPENEMR_OAUTH_BASE = f"{OPENEMR_BASE_URL}/oauth2/default"
 CLIENT_ID = os.getenv("OPENEMR_CLIENT_ID", "")
 CLIENT_SECRET = os.getenv("OPENEMR_CLIENT_SECRET", "")
 REDIRECT_URI = os.getenv("OPENEMR_REDIRECT_URI", "http://localhost:8000/oauth/callback")
+OPENEMR_CA_BUNDLE = os.getenv("OPENEMR_CA_BUNDLE", "")
+OPENEMR_TIMEOUT = float(os.getenv("OPENEMR_TIMEOUT", "30"))  # Seconds per upstream request
+OPENEMR_MAX_CONCURRENCY = int(os.getenv("OPENEMR_MAX_CONCURRENCY", "64"))
+OPENEMR_LATENCY_TARGET = float(os.getenv("OPENEMR_LATENCY_TARGET", "1.0"))
+# Headers sent with every OpenEMR API request (read-only; merged per call only when needed).
+# Accept-Encoding is left to httpx, which advertises gzip/deflate/br and decodes transparently.
+BASE_HEADERS = MappingProxyType({
+    "Accept": "application/fhir+json",
+    "Content-Type": "application/json"
+})
+# Upstream headers forwarded when a response body is streamed through. Bodies are relayed
+# decoded, so Content-Encoding/Length are dropped and GZipMiddleware negotiates with the client.
+STREAM_PASSTHROUGH_HEADERS = ("etag", "last-modified")
+RATE_LIMIT_DEFAULT_PAUSE = 1.0  # Seconds to back off when OpenEMR omits Retry-After
+OPENEMR_RPM_LIMIT = int(os.getenv("OPENEMR_RPM_LIMIT", "0"))  # Per-resource requests/minute; 0 disables
+FHIR_METADATA_CACHE_TTL = float(os.getenv("FHIR_METADATA_CACHE_TTL", "300"))
+REDIS_URL = os.getenv("REDIS_URL", "")  # e.g. redis://localhost:6379/0; response caching is off when unset
+RESPONSE_CACHE_PREFIX = "oemr:"
+# Upstream paths with an id segment, bound once; ids are percent-encoded so they stay one segment
+FHIR_PATIENT_PATH = "/fhir/Patient/{}".format
+API_PATIENT_PATH = "/api/patient/{}".format
+API_PATIENT_ENCOUNTERS_PATH = "/api/patient/{}/encounter".format
+# Patient-scoped FHIR searches that /fhir/patient-snapshot may combine
+PATIENT_SNAPSHOT_RESOURCES = frozenset(
+    {"Observation", "Encounter", "MedicationRequest", "Condition", "Procedure", "Appointment"}
+)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # Shared secret for /admin endpoints; they 404 when unset
+
+
+def build_ssl_context() -> ssl.SSLContext:
+    """Build the TLS context shared by every OpenEMR connection"""
+    ctx = ssl.create_default_context()
+    if OPENEMR_CA_BUNDLE:
+        ctx.load_verify_locations(cafile=OPENEMR_CA_BUNDLE)
+    else:
+        # Development default: OpenEMR is commonly served with a self-signed certificate
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+    return ctx
+
+
+SSL_CONTEXT = build_ssl_context()
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Create the pooled client shared by every OpenEMR call in this process"""
+    return httpx.AsyncClient(
+        base_url=OPENEMR_BASE_URL,
+        verify=SSL_CONTEXT,
+        timeout=httpx.Timeout(OPENEMR_TIMEOUT, connect=5.0),
+        # Idle connections are kept for a minute so bursty search traffic reuses warm TLS sessions
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=100, keepalive_expiry=60),
+        http2=True,  # Multiplex concurrent FHIR calls over one connection
+    )
 
 # In-memory token storage (use database in production)
-token_storage: Dict[str, Dict[str, Any]] = {}
+# Bounded caches: entries expire on access, so no sweeper is needed and memory stays capped
+def token_expiry(_access_token: str, entry: Dict[str, Any], now: float) -> float:
+    """Expire each stored token at its own expires_in, measured on the monotonic clock"""
+    return now + entry["token_data"].get("expires_in", 3600)
+
+
+token_storage: TLRUCache = TLRUCache(maxsize=10_000, ttu=token_expiry, timer=time.monotonic)
+oauth_states: TTLCache = TTLCache(maxsize=10_000, ttl=600)
+
+# The FHIR CapabilityStatement is effectively static, so keep the last copy for a few minutes
+capability_cache: TTLCache = TTLCache(maxsize=1, ttl=FHIR_METADATA_CACHE_TTL)
 
 # OAuth2 scheme (using HTTPBearer for Swagger UI compatibility)
 # Note: oauth2_scheme is defined but not currently used - kept for potential future use
 
 
+# Schema examples (built once at import and shared by the models below)
+TOKEN_REQUEST_EXAMPLE = {
+    "grant_type": "authorization_code",
+    "code": "abc123xyz",
+    "redirect_uri": "http://localhost:8000/oauth/callback",
+    "code_verifier": "optional_pkce_verifier"
+}
+
+TOKEN_RESPONSE_EXAMPLE = {
+    "access_token": "eyJhbGciOiJSUzI1NiIsInR5cCI6IkpXVCJ9...",
+    "token_type": "Bearer",
+    "expires_in": 3600,
+    "refresh_token": "def456uvw",
+    "scope": "openid api:fhir patient/Patient.rs",
+    "id_token": "eyJhbGciOiJSUzI1NiIsInR5cCI6IkpXVCJ9..."
+}
+
+CLIENT_REGISTRATION_EXAMPLE = {
+    "client_name": "My Healthcare App",
+    "redirect_uris": ["http://localhost:8000/oauth/callback"],
+    "scope": "openid api:fhir patient/Patient.rs user/Patient.rs",
+    "token_endpoint_auth_method": "client_secret_basic"
+}
+
+PATIENT_SEARCH_EXAMPLE = {
+    "name": "John Doe",
+    "birthdate": "1990-01-01",
+    "identifier": "12345",
+    "_count": 10,
+    "_sort": "name"
+}
+
+PATIENT_CREATE_EXAMPLE = {
+    "fname": "John",
+    "lname": "Doe",
+    "dob": "1990-01-01",
+    "sex": "Male",
+    "street": "123 Main St",
+    "city": "Springfield",
+    "state": "IL",
+    "postal_code": "62701",
+    "phone_cell": "555-1234",
+    "email": "john.doe@example.com"
+}
+
+OBSERVATION_SEARCH_EXAMPLE = {
+    "patient": "Patient/123",
+    "category": "vital-signs",
+    "code": "85354-9",
+    "_count": 10
+}
+
+ENCOUNTER_SEARCH_EXAMPLE = {
+    "patient": "Patient/123",
+    "status": "finished",
+    "date": "2024-01-01",
+    "_count": 10
+}
+
+
 # Pydantic Models
 class TokenRequest(BaseModel):
-    model_config = ConfigDict(
-        json_schema_extra={
-            "example": {
-                "grant_type": "authorization_code",
-                "code": "abc123xyz",
-                "redirect_uri": "http://localhost:8000/oauth/callback",
-                "code_verifier": "optional_pkce_verifier"
-            }
-        }
-    )
+    model_config = ConfigDict(json_schema_extra={"example": TOKEN_REQUEST_EXAMPLE})
     grant_type: str = Field(..., description="Grant type: 'authorization_code' or 'refresh_token'", examples=["authorization_code", "refresh_token"])
     code: Optional[str] = Field(None, description="Authorization code (required for authorization_code grant)")
     redirect_uri: Optional[str] = Field(None, description="Redirect URI (must match registered URI)")
@@ -126,18 +416,7 @@ class TokenRequest(BaseModel):
 
 
 class TokenResponse(BaseModel):
-    model_config = ConfigDict(
-        json_schema_extra={
-            "example": {
-                "access_token": "eyJhbGciOiJSUzI1NiIsInR5cCI6IkpXVCJ9...",
-                "token_type": "Bearer",
-                "expires_in": 3600,
-                "refresh_token": "def456uvw",
-                "scope": "openid api:fhir patient/Patient.rs",
-                "id_token": "eyJhbGciOiJSUzI1NiIsInR5cCI6IkpXVCJ9..."
-            }
-        }
-    )
+    model_config = ConfigDict(json_schema_extra={"example": TOKEN_RESPONSE_EXAMPLE})
     access_token: str = Field(..., description="OAuth 2.0 access token")
     token_type: str = Field(default="Bearer", description="Token type")
     expires_in: Optional[int] = Field(None, description="Token expiration time in seconds")
@@ -147,16 +426,7 @@ class TokenResponse(BaseModel):
 
 
 class ClientRegistration(BaseModel):
-    model_config = ConfigDict(
-        json_schema_extra={
-            "example": {
-                "client_name": "My Healthcare App",
-                "redirect_uris": ["http://localhost:8000/oauth/callback"],
-                "scope": "openid api:fhir patient/Patient.rs user/Patient.rs",
-                "token_endpoint_auth_method": "client_secret_basic"
-            }
-        }
-    )
+    model_config = ConfigDict(json_schema_extra={"example": CLIENT_REGISTRATION_EXAMPLE})
     client_name: str = Field(..., description="Name of your application", examples=["My Healthcare App"])
     redirect_uris: List[str] = Field(..., description="List of allowed redirect URIs", examples=[["http://localhost:8000/oauth/callback"]])
     scope: Optional[str] = Field(None, description="Space-separated list of requested scopes", examples=["openid api:fhir patient/Patient.rs"])
@@ -164,17 +434,7 @@ class ClientRegistration(BaseModel):
 
 
 class PatientSearch(BaseModel):
-    model_config = ConfigDict(
-        json_schema_extra={
-            "example": {
-                "name": "John Doe",
-                "birthdate": "1990-01-01",
-                "identifier": "12345",
-                "_count": 10,
-                "_sort": "name"
-            }
-        }
-    )
+    model_config = ConfigDict(json_schema_extra={"example": PATIENT_SEARCH_EXAMPLE})
     name: Optional[str] = Field(None, description="Patient name to search", examples=["John Doe"])
     birthdate: Optional[str] = Field(None, description="Patient birthdate (YYYY-MM-DD)", examples=["1990-01-01"])
     identifier: Optional[str] = Field(None, description="Patient identifier", examples=["12345"])
@@ -184,22 +444,7 @@ class PatientSearch(BaseModel):
 
 
 class PatientCreate(BaseModel):
-    model_config = ConfigDict(
-        json_schema_extra={
-            "example": {
-                "fname": "John",
-                "lname": "Doe",
-                "dob": "1990-01-01",
-                "sex": "Male",
-                "street": "123 Main St",
-                "city": "Springfield",
-                "state": "IL",
-                "postal_code": "62701",
-                "phone_cell": "555-1234",
-                "email": "john.doe@example.com"
-            }
-        }
-    )
+    model_config = ConfigDict(json_schema_extra={"example": PATIENT_CREATE_EXAMPLE})
     fname: str = Field(..., description="First name", examples=["John"])
     lname: str = Field(..., description="Last name", examples=["Doe"])
     dob: str = Field(..., description="Date of birth (YYYY-MM-DD)", examples=["1990-01-01"])
@@ -213,16 +458,7 @@ class PatientCreate(BaseModel):
 
 
 class ObservationSearch(BaseModel):
-    model_config = ConfigDict(
-        json_schema_extra={
-            "example": {
-                "patient": "Patient/123",
-                "category": "vital-signs",
-                "code": "85354-9",
-                "_count": 10
-            }
-        }
-    )
+    model_config = ConfigDict(json_schema_extra={"example": OBSERVATION_SEARCH_EXAMPLE})
     patient: Optional[str] = Field(None, description="Patient reference (e.g., Patient/123)", examples=["Patient/123"])
     category: Optional[str] = Field(None, description="Observation category", examples=["vital-signs", "laboratory"])
     code: Optional[str] = Field(None, description="LOINC code for the observation", examples=["85354-9"])
@@ -231,16 +467,7 @@ class ObservationSearch(BaseModel):
 
 
 class EncounterSearch(BaseModel):
-    model_config = ConfigDict(
-        json_schema_extra={
-            "example": {
-                "patient": "Patient/123",
-                "status": "finished",
-                "date": "2024-01-01",
-                "_count": 10
-            }
-        }
-    )
+    model_config = ConfigDict(json_schema_extra={"example": ENCOUNTER_SEARCH_EXAMPLE})
     patient: Optional[str] = Field(None, description="Patient reference", examples=["Patient/123"])
     status: Optional[str] = Field(None, description="Encounter status", examples=["planned", "in-progress", "finished"])
     date: Optional[str] = Field(None, description="Encounter date (FHIR date format)", examples=["2024-01-01"])
@@ -248,50 +475,501 @@ class EncounterSearch(BaseModel):
     sort: Optional[str] = Field(None, alias="_sort", description="Sort criteria")
 
 
+class ConcurrencyUpdate(BaseModel):
+    max_concurrent: int = Field(..., ge=1, description="Upper bound on in-flight OpenEMR requests", examples=[64])
+
+
+# (attribute, query parameter) pairs per search model, so building upstream params
+# is one attribute loop instead of a model_dump() followed by filtering
+SEARCH_FIELDS = {
+    model: tuple((name, field.alias or name) for name, field in model.model_fields.items())
+    for model in (PatientSearch, ObservationSearch, EncounterSearch)
+}
+
+
+def search_params(search: BaseModel) -> Dict[str, Any]:
+    """Upstream query params from a search model, omitting unset fields"""
+    return {
+        alias: value
+        for name, alias in SEARCH_FIELDS[type(search)]
+        if (value := getattr(search, name)) is not None
+    }
+
+
+# Upstream Concurrency Control
+class AdmissionController:
+    """
+    Gate on the number of in-flight OpenEMR requests.
+    
+    A counter under a Condition (rather than a Semaphore) lets
+    ``max_concurrent`` be raised or lowered while requests are waiting.
+    """
+
+    def __init__(self, max_concurrent: int = 64):
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self._condition = asyncio.Condition(asyncio.Lock())
+
+    async def __aenter__(self) -> "AdmissionController":
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.active < self.max_concurrent)
+            self.active += 1
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        async with self._condition:
+            self.active -= 1
+            self._admit()
+
+    async def resize(self, max_concurrent: int) -> None:
+        """Change the bound, admitting waiters into any slots it opens"""
+        async with self._condition:
+            self.max_concurrent = max_concurrent
+            self._admit()
+
+    def _admit(self) -> None:
+        # Called with the condition held: wake one waiter per free slot
+        free = self.max_concurrent - self.active
+        if free > 0:
+            self._condition.notify(free)
+
+
+class AIMDLimiter:
+    """
+    Adaptive limit on in-flight OpenEMR requests, enforced by its own AdmissionController.
+    
+    The limit grows additively while the recent mean latency stays within
+    target and is cut multiplicatively when latency degrades or OpenEMR
+    signals overload (429/502/503 or a dropped connection). Only calls sent
+    after the last cut can trigger another, so a burst of slow completions
+    counts as one congestion event.
+    """
+
+    OVERLOAD_STATUS_CODES = (429, 502, 503)
+
+    def __init__(
+        self,
+        initial_limit: int = 16,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        latency_target: float = 1.0,
+        alpha: float = 0.5,
+        beta: float = 0.5,
+        window: int = 20
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.alpha = alpha
+        self.beta = beta
+        self._latencies: deque = deque(maxlen=window)
+        self._last_cut = float("-inf")  # Monotonic time of the last decrease
+        self.limit = self._clamp(float(initial_limit))
+        self.admission = AdmissionController(max_concurrent=int(self.limit))
+
+    async def observe(self, latency: float, status_code: int, record_latency: bool = True) -> None:
+        """
+        Feed one completed upstream call back into the limit
+        
+        Pass ``record_latency=False`` for calls whose latency is not
+        comparable to ordinary searches (streamed bodies, generated
+        documents); their status codes still count.
+        """
+        sent_at = time.monotonic() - latency
+        if status_code in self.OVERLOAD_STATUS_CODES:
+            await self.congested(sent_at)
+            return
+        if not record_latency or sent_at < self._last_cut:
+            return  # Not a sample of the current limit
+        self._latencies.append(latency)
+        if sum(self._latencies) / len(self._latencies) <= self.latency_target:
+            # Adds about alpha per round of `limit` successful calls
+            await self._resize(self.limit + self.alpha / self.limit)
+        else:
+            await self.congested(sent_at)
+
+    async def congested(self, sent_at: float) -> None:
+        """Decrease for a congestion signal from a call sent at ``sent_at``, once per event"""
+        if sent_at >= self._last_cut:
+            await self.decrease()
+
+    async def decrease(self) -> None:
+        """Multiplicatively shrink the limit and start a fresh latency window"""
+        self._latencies.clear()
+        self._last_cut = time.monotonic()
+        await self._resize(self.limit * self.beta)
+
+    async def set_max_limit(self, max_limit: int) -> None:
+        """Move the ceiling; a limit already pinned at the old ceiling follows it"""
+        saturated = self.limit >= self.max_limit
+        self.max_limit = max(max_limit, self.min_limit)
+        await self._resize(float(self.max_limit) if saturated else self.limit)
+
+    def _clamp(self, limit: float) -> float:
+        return max(float(self.min_limit), min(limit, float(self.max_limit)))
+
+    async def _resize(self, limit: float) -> None:
+        self.limit = self._clamp(limit)
+        # Every bound change goes through resize() so a raised limit admits waiters at once
+        if int(self.limit) != self.admission.max_concurrent:
+            await self.admission.resize(int(self.limit))
+
+
+class SlidingWindowLimiter:
+    """
+    Per-key sliding-window request counter.
+    
+    Throttles proactively against a known requests-per-minute budget so the
+    proxy does not have to discover OpenEMR's limit through 429 responses.
+    """
+
+    def __init__(self, requests_per_minute: int, period: float = 60.0):
+        self.requests_per_minute = requests_per_minute
+        self.period = period
+        self._windows: Dict[str, deque] = {}
+
+    async def acquire(self, key: str) -> None:
+        """Wait until a request for ``key`` fits in the current window, then record it"""
+        if self.requests_per_minute <= 0:
+            return
+        window = self._windows.setdefault(key, deque())
+        while True:
+            now = time.monotonic()
+            while window and window[0] <= now - self.period:
+                window.popleft()
+            if len(window) < self.requests_per_minute:
+                window.append(now)
+                return
+            await asyncio.sleep(window[0] + self.period - now)
+
+
+def rate_limit_key(endpoint: str) -> str:
+    """Group an endpoint by API and resource type, e.g. /fhir/Patient/123 -> /fhir/Patient"""
+    return "/".join(endpoint.split("/")[:3])
+
+
 # Helper Functions
-async def get_access_token(authorization: Optional[str] = Header(None)) -> Optional[str]:
-    """Extract access token from Authorization header"""
+def get_access_token(authorization: Optional[str]) -> Optional[str]:
+    """
+    Extract access token from Authorization header
+    
+    No validation happens here: OpenEMR checks the token on every proxied
+    call, so there is no introspection round trip to cache.
+    """
     if authorization and authorization.startswith("Bearer "):
-        return authorization.replace("Bearer ", "")
+        return authorization[7:]
     return None
 
 
+def drop_none(**params: Any) -> Dict[str, Any]:
+    """Build upstream query params from explicit keyword arguments, omitting unset ones"""
+    return {k: v for k, v in params.items() if v is not None}
+
+
+# Auth dependencies do no I/O but are async so FastAPI calls them inline, not via the threadpool
+async def require_bearer(request: Request) -> str:
+    """Dependency returning the bearer token set by BearerTokenMiddleware, or raising 401"""
+    token = getattr(request.state, "bearer_token", None)
+    if not token:
+        raise HTTPException(status_code=401, detail="Authorization header with Bearer token required")
+    return token
+
+
+async def revalidation_headers(request: Request) -> Optional[Dict[str, str]]:
+    """Dependency forwarding the client's If-None-Match, so OpenEMR can answer a streamed GET with 304"""
+    if_none_match = request.headers.get("if-none-match")
+    return {"If-None-Match": if_none_match} if if_none_match else None
+
+
+async def require_admin(
+    x_admin_token: Optional[str] = Header(None, description="Value of ADMIN_TOKEN")
+) -> None:
+    """Dependency guarding /admin endpoints; they do not exist unless ADMIN_TOKEN is configured"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given as delta-seconds or an HTTP-date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def note_rate_limit_headers(response: httpx.Response) -> None:
+    """Pause upstream calls when OpenEMR reports its rate limit is (nearly) exhausted"""
+    retry_after = parse_retry_after(response.headers.get("retry-after"))
+    pause = None
+    if response.status_code == 429:
+        pause = retry_after if retry_after is not None else RATE_LIMIT_DEFAULT_PAUSE
+    else:
+        try:
+            remaining = int(response.headers["x-ratelimit-remaining-requests"])
+            limit = int(response.headers.get("x-ratelimit-limit-requests", 0))
+        except (KeyError, ValueError):
+            return
+        if remaining <= max(2, 0.1 * limit):
+            pause = retry_after if retry_after is not None else RATE_LIMIT_DEFAULT_PAUSE
+    if pause:
+        app.state.pause_until = max(app.state.pause_until, time.monotonic() + pause)
+
+
+def upstream_error(e: httpx.HTTPStatusError) -> HTTPException:
+    """Relay an OpenEMR error status, with its JSON body as the detail when it has one"""
+    try:
+        detail = orjson.loads(e.response.content)
+    except orjson.JSONDecodeError:
+        # Empty bodies and HTML error pages from a gateway in front of OpenEMR
+        detail = {"error": str(e)}
+    return HTTPException(status_code=e.response.status_code, detail=detail)
+
+
+async def wait_for_rate_limit() -> None:
+    """Sleep until any pause requested by OpenEMR's rate-limit headers has elapsed"""
+    delay = app.state.pause_until - time.monotonic()
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+async def observed_send(request: httpx.Request, stream: bool = False) -> httpx.Response:
+    """Send one upstream request, feeding its latency and rate-limit headers back into the gates"""
+    limiter: AIMDLimiter = app.state.limiter
+    started = time.monotonic()
+    try:
+        response = await app.state.http.send(request, stream=stream)
+    except httpx.RequestError:
+        await limiter.congested(started)
+        raise
+    # Streamed calls ($docref, Patient bundles) are slow by nature; keep them out of the latency window
+    await limiter.observe(time.monotonic() - started, response.status_code, record_latency=not stream)
+    note_rate_limit_headers(response)
+    return response
+
+
+async def oauth_post(path: str, **kwargs: Any) -> httpx.Response:
+    """POST to OpenEMR's OAuth server through the same pause, RPM and admission gates as API calls"""
+    await wait_for_rate_limit()
+    await app.state.rpm.acquire(rate_limit_key(path))
+    async with app.state.admission:
+        return await observed_send(app.state.http.build_request("POST", f"{OPENEMR_OAUTH_BASE}{path}", **kwargs))
+
+
+async def relay_stream(response: httpx.Response, release: Callable[[], Awaitable[None]]) -> AsyncIterator[bytes]:
+    """Yield an upstream body as it arrives, calling ``release`` however the relay ends"""
+    try:
+        async for chunk in response.aiter_bytes():
+            yield chunk
+    finally:
+        await release()
+
+
 async def make_openemr_request(
     method: str,
     endpoint: str,
     token: Optional[str] = None,
     params: Optional[Dict] = None,
     json_data: Optional[Dict] = None,
-    headers: Optional[Dict] = None
-) -> Dict[str, Any]:
-    """Make HTTP request to OpenEMR API"""
-    url = f"{OPENEMR_API_BASE}{endpoint}"
+    content: Optional[Union[bytes, str]] = None,
+    headers: Optional[Dict] = None,
+    stream: bool = False
+) -> Union[Dict[str, Any], StreamingResponse]:
+    """
+    Make HTTP request to OpenEMR API
     
-    request_headers = headers or {}
-    if token:
-        request_headers["Authorization"] = f"Bearer {token}"
-    request_headers.setdefault("Accept", "application/fhir+json")
-    request_headers.setdefault("Content-Type", "application/json")
+    With ``stream=True`` a successful body is relayed to the client as it
+    arrives (decompressed once by httpx) instead of being parsed and
+    re-serialized. The admission slot is then held until the relay ends.
+    Bodies that are already JSON-encoded go in ``content`` rather than
+    ``json_data`` to skip httpx's encoder.
+    """
+    url = f"{OPENEMR_API_BASE}{endpoint}"
     
-    async with httpx.AsyncClient(verify=False, timeout=30.0) as client:
-        try:
-            response = await client.request(
-                method=method,
-                url=url,
-                headers=request_headers,
-                params=params,
-                json=json_data
+    if token or headers:
+        request_headers = {**BASE_HEADERS, **(headers or {})}
+        if token:
+            request_headers["Authorization"] = f"Bearer {token}"
+    else:
+        request_headers = BASE_HEADERS
+    
+    slot = AsyncExitStack()
+    relaying = False
+    try:
+        await wait_for_rate_limit()
+        await app.state.rpm.acquire(rate_limit_key(endpoint))
+        await slot.enter_async_context(app.state.admission)
+        request = app.state.http.build_request(
+            method=method,
+            url=url,
+            headers=request_headers,
+            params=params,
+            json=json_data,
+            content=content
+        )
+        response = await observed_send(request, stream=stream)
+        if stream and response.status_code == 304:
+            await response.aclose()
+            return Response(
+                status_code=304,
+                headers={name: response.headers[name] for name in STREAM_PASSTHROUGH_HEADERS if name in response.headers}
             )
-            response.raise_for_status()
-            return response.json() if response.content else {}
-        except httpx.HTTPStatusError as e:
-            error_detail = e.response.json() if e.response.content else {"error": str(e)}
-            raise HTTPException(
-                status_code=e.response.status_code,
-                detail=error_detail
+        if stream and not response.is_success:
+            # Non-2xx bodies are small; buffer them so the detail can be reported below
+            await response.aread()
+            await response.aclose()
+        response.raise_for_status()
+        if stream:
+            async def release():
+                await response.aclose()
+                await slot.aclose()
+            
+            relaying = True
+            # The background task covers a body that is never iterated (client gone first)
+            return StreamingResponse(
+                relay_stream(response, release),
+                status_code=response.status_code,
+                media_type=response.headers.get("content-type", "application/fhir+json"),
+                headers={
+                    name: response.headers[name]
+                    for name in STREAM_PASSTHROUGH_HEADERS
+                    if name in response.headers
+                },
+                background=BackgroundTask(release)
             )
-        except httpx.RequestError as e:
-            raise HTTPException(status_code=500, detail=f"Request error: {str(e)}")
+        body = response.content
+        return orjson.loads(body) if body else {}
+    except httpx.HTTPStatusError as e:
+        raise upstream_error(e)
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=500, detail=f"Request error: {str(e)}")
+    finally:
+        if not relaying:
+            await slot.aclose()
+
+
+# Response Caching
+def response_cache() -> Optional[redis.Redis]:
+    """Return the Redis response cache, or None when caching is disabled or not started"""
+    return getattr(app.state, "redis", None)
+
+
+def response_cache_key(resource: str, handler: str, credential: str, arguments: Dict[str, Any]) -> str:
+    """Build the Redis key for one handler's query made with one credential"""
+    material = orjson.dumps(
+        {
+            name: value.model_dump(mode="json") if isinstance(value, BaseModel) else value
+            for name, value in arguments.items()
+        },
+        option=orjson.OPT_SORT_KEYS
+    )
+    digest = hashlib.sha256(credential.encode() + b"\0" + material).hexdigest()
+    return f"{RESPONSE_CACHE_PREFIX}{resource}:{handler}:{digest}"
+
+
+# Upstream calls currently in progress, keyed by response cache key
+inflight: Dict[str, asyncio.Future] = {}
+
+
+async def single_flight(key: str, call):
+    """Run ``call`` once for all concurrent callers sharing ``key``"""
+    future = inflight.get(key)
+    if future is not None:
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                raise
+            # The leading caller went away before finishing; make the call ourselves
+    future = asyncio.get_running_loop().create_future()
+    inflight[key] = future
+    try:
+        result = await call()
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as exc:
+        future.set_exception(exc)
+        future.exception()  # Mark retrieved so an unawaited failure is not logged
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        if inflight.get(key) is future:
+            del inflight[key]
+
+
+def cached(resource: str, ttl: int = 60):
+    """
+    Cache a GET handler's JSON result in Redis for ``ttl`` seconds.
+    
+    Entries are keyed by the handler's arguments and a hash of the caller's
+    bearer token, so a response is only replayed to the credential that
+    produced it. Responses carry ``X-Cache: HIT`` or ``MISS``. Concurrent
+    identical misses are coalesced into one upstream call, even when
+    REDIS_URL is unset; Redis errors degrade to a cache miss. Handlers that
+    return their own Response (e.g. streams) must not be decorated.
+    
+    The token comes from require_bearer without any I/O, so the Redis GET
+    is the only await on the hit path and there is nothing to overlap it with.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            credential = kwargs.get("token", "")
+            arguments = {k: v for k, v in kwargs.items() if k != "token"}
+            key = response_cache_key(resource, func.__name__, credential, arguments)
+            cache = response_cache()
+            if cache is not None:
+                try:
+                    body = await cache.get(key)
+                except redis.RedisError:
+                    body = None
+                if body is not None:
+                    return Response(content=body, media_type="application/json", headers={"X-Cache": "HIT"})
+            
+            async def fetch():
+                result = await func(*args, **kwargs)
+                if cache is None or isinstance(result, Response):
+                    return result
+                body = orjson.dumps(result, option=ORJSON_OPTIONS)
+                try:
+                    await cache.setex(key, ttl, body)
+                except redis.RedisError:
+                    pass
+                return body
+            
+            # Concurrent misses for the same key share one upstream call; each caller
+            # gets its own Response since middleware may rewrite response headers
+            result = await single_flight(key, fetch)
+            if isinstance(result, bytes):
+                return Response(content=result, media_type="application/json", headers={"X-Cache": "MISS"})
+            return result
+        return wrapper
+    return decorator
+
+
+async def invalidate_cached(*resources: str) -> None:
+    """Drop cached responses under the given resource paths after a write"""
+    cache = response_cache()
+    if cache is None:
+        return
+    try:
+        for resource in resources:
+            keys = [key async for key in cache.scan_iter(match=f"{RESPONSE_CACHE_PREFIX}{resource}*")]
+            if keys:
+                await cache.unlink(*keys)
+    except redis.RedisError:
+        pass
 
 
 # Authentication Endpoints
@@ -376,18 +1054,17 @@ async def oauth_authorize(
     # Generate state if not provided
     if not state:
         state = secrets.token_urlsafe(32)
-        token_storage[state] = {"type": "oauth_state"}
-    
-    auth_url = (
-        f"{OPENEMR_OAUTH_BASE}/authorize"
-        f"?response_type={response_type}"
-        f"&client_id={client}"
-        f"&redirect_uri={redirect}"
-        f"&scope={scope}"
-        f"&state={state}"
-    )
+        oauth_states[state] = {"type": "oauth_state"}
+    
+    query = urlencode({
+        "response_type": response_type,
+        "client_id": client,
+        "redirect_uri": redirect,
+        "scope": scope,
+        "state": state
+    })
     
-    return RedirectResponse(url=auth_url)
+    return RedirectResponse(url=f"{OPENEMR_OAUTH_BASE}/authorize?{query}")
 
 
 @app.get(
@@ -435,30 +1112,24 @@ async def oauth_callback(
         "client_secret": CLIENT_SECRET
     }
     
-    async with httpx.AsyncClient(verify=False, timeout=30.0) as client:
-        try:
-            response = await client.post(
-                f"{OPENEMR_OAUTH_BASE}/token",
-                data=token_data,
-                headers={"Content-Type": "application/x-www-form-urlencoded"}
-            )
-            response.raise_for_status()
-            token_response = response.json()
-            
-            # Store token (in production, use secure storage)
-            if "access_token" in token_response:
-                token_storage[token_response["access_token"]] = {
-                    "token_data": token_response,
-                    "expires_at": datetime.now() + timedelta(seconds=token_response.get("expires_in", 3600))
-                }
-            
-            return token_response
-        except httpx.HTTPStatusError as e:
-            error_detail = e.response.json() if e.response.content else {"error": str(e)}
-            raise HTTPException(
-                status_code=e.response.status_code,
-                detail=error_detail
-            )
+    try:
+        response = await oauth_post(
+            "/token",
+            data=token_data,
+            headers={"Content-Type": "application/x-www-form-urlencoded"}
+        )
+        response.raise_for_status()
+        token_response = orjson.loads(response.content)
+        
+        # Store token (in production, use secure storage)
+        if "access_token" in token_response:
+            token_storage[token_response["access_token"]] = {
+                "token_data": token_response
+            }
+        
+        return token_response
+    except httpx.HTTPStatusError as e:
+        raise upstream_error(e)
 
 
 @app.post(
@@ -525,21 +1196,16 @@ async def get_token(token_request: TokenRequest):
     if CLIENT_SECRET:
         data["client_secret"] = CLIENT_SECRET
     
-    async with httpx.AsyncClient(verify=False, timeout=30.0) as client:
-        try:
-            response = await client.post(
-                f"{OPENEMR_OAUTH_BASE}/token",
-                data=data,
-                headers={"Content-Type": "application/x-www-form-urlencoded"}
-            )
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPStatusError as e:
-            error_detail = e.response.json() if e.response.content else {"error": str(e)}
-            raise HTTPException(
-                status_code=e.response.status_code,
-                detail=error_detail
-            )
+    try:
+        response = await oauth_post(
+            "/token",
+            data=data,
+            headers={"Content-Type": "application/x-www-form-urlencoded"}
+        )
+        response.raise_for_status()
+        return orjson.loads(response.content)
+    except httpx.HTTPStatusError as e:
+        raise upstream_error(e)
 
 
 @app.post(
@@ -584,24 +1250,20 @@ async def register_client(registration: ClientRegistration):
     
     Register a new OAuth client application with OpenEMR.
     """
-    async with httpx.AsyncClient(verify=False, timeout=30.0) as client:
-        try:
-            response = await client.post(
-                f"{OPENEMR_OAUTH_BASE}/registration",
-                json=registration.model_dump(),
-                headers={"Content-Type": "application/json"}
-            )
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPStatusError as e:
-            error_detail = e.response.json() if e.response.content else {"error": str(e)}
-            raise HTTPException(
-                status_code=e.response.status_code,
-                detail=error_detail
-            )
+    try:
+        response = await oauth_post(
+            "/registration",
+            json=registration.model_dump(mode="json"),
+            headers={"Content-Type": "application/json"}
+        )
+        response.raise_for_status()
+        return orjson.loads(response.content)
+    except httpx.HTTPStatusError as e:
+        raise upstream_error(e)
 
 
 # FHIR API Endpoints
+# The CapabilityStatement is public, so it stays on the app rather than the authenticated router
 @app.get(
     "/fhir/metadata",
     tags=["FHIR"],
@@ -635,12 +1297,20 @@ async def get_capability_statement():
     
     Returns the FHIR metadata/capability statement (no authentication required).
     """
-    return await make_openemr_request("GET", "/fhir/metadata")
+    metadata = capability_cache.get("metadata")
+    if metadata is None:
+        metadata = await make_openemr_request("GET", "/fhir/metadata")
+        capability_cache["metadata"] = metadata
+    return metadata
 
 
-@app.get(
-    "/fhir/Patient",
-    tags=["FHIR"],
+# Every other FHIR route needs a bearer token; handlers that forward it also declare
+# Depends(require_bearer), which FastAPI resolves once per request
+fhir_router = APIRouter(prefix="/fhir", tags=["FHIR"], dependencies=[Depends(require_bearer)])
+
+
+@fhir_router.get(
+    "/Patient",
     summary="Search Patients (FHIR)",
     description="""
     Search for patient resources using FHIR R4 search parameters.
@@ -680,24 +1350,23 @@ async def get_capability_statement():
 )
 async def search_patients(
     search: PatientSearch = Depends(),
-    authorization: Optional[str] = Header(None, description="Bearer token for authentication")
+    token: str = Depends(require_bearer),
+    validators: Optional[Dict[str, str]] = Depends(revalidation_headers)
 ):
     """
     Search for Patients (FHIR)
     
     Search for patient resources using FHIR search parameters.
     """
-    token = await get_access_token(authorization)
-    if not token:
-        raise HTTPException(status_code=401, detail="Authorization header with Bearer token required")
-    
-    params = {k: v for k, v in search.model_dump(by_alias=True).items() if v is not None}
-    return await make_openemr_request("GET", "/fhir/Patient", token=token, params=params)
+    params = search_params(search)
+    # Patient bundles can be large; relay them without buffering
+    return await make_openemr_request(
+        "GET", "/fhir/Patient", token=token, params=params, headers=validators, stream=True
+    )
 
 
-@app.get(
-    "/fhir/Patient/{patient_id}",
-    tags=["FHIR"],
+@fhir_router.get(
+    "/Patient/{patient_id}",
     summary="Get Patient by ID (FHIR)",
     description="""
     Retrieve a specific patient resource by ID.
@@ -728,24 +1397,19 @@ async def search_patients(
 )
 async def get_patient(
     patient_id: str,
-    authorization: Optional[str] = Header(None, description="Bearer token for authentication")
+    token: str = Depends(require_bearer)
 ):
     """
     Get Patient by ID (FHIR)
     
     Retrieve a specific patient resource by ID.
     """
-    token = await get_access_token(authorization)
-    if not token:
-        raise HTTPException(status_code=401, detail="Authorization header with Bearer token required")
-    
-    return await make_openemr_request("GET", f"/fhir/Patient/{patient_id}", token=token)
+    return await make_openemr_request("GET", FHIR_PATIENT_PATH(quote(patient_id, safe="")), token=token)
 
 
-@app.post(
-    "/fhir/Patient",
+@fhir_router.post(
+    "/Patient",
     status_code=status.HTTP_201_CREATED,
-    tags=["FHIR"],
     summary="Create Patient (FHIR)",
     description="""
     Create a new patient resource using FHIR R4 format.
@@ -801,182 +1465,191 @@ async def create_patient(
             "identifier": [{"system": "http://hospital.example.org", "value": "123456"}]
         }]
     ),
-    authorization: Optional[str] = Header(None, description="Bearer token for authentication")
+    token: str = Depends(require_bearer)
 ):
     """
     Create Patient (FHIR)
     
     Create a new patient resource.
     """
-    token = await get_access_token(authorization)
-    if not token:
-        raise HTTPException(status_code=401, detail="Authorization header with Bearer token required")
-    
-    return await make_openemr_request("POST", "/fhir/Patient", token=token, json_data=patient)
+    created = await make_openemr_request("POST", "/fhir/Patient", token=token, content=orjson.dumps(patient))
+    await invalidate_cached("/fhir/Patient", "/api/patient")
+    return created
 
 
-@app.get("/fhir/Observation")
+@fhir_router.get("/Observation")
+@cached("/fhir/Observation", ttl=60)
 async def search_observations(
     search: ObservationSearch = Depends(),
-    authorization: Optional[str] = Header(None)
+    token: str = Depends(require_bearer)
 ):
     """
     Search Observations (FHIR)
     
     Search for observation resources (vital signs, lab results, etc.).
     """
-    token = await get_access_token(authorization)
-    if not token:
-        raise HTTPException(status_code=401, detail="Authorization header with Bearer token required")
-    
-    params = {k: v for k, v in search.model_dump(by_alias=True).items() if v is not None}
+    params = search_params(search)
     return await make_openemr_request("GET", "/fhir/Observation", token=token, params=params)
 
 
-@app.get("/fhir/Encounter")
+@fhir_router.get("/Encounter")
+@cached("/fhir/Encounter", ttl=60)
 async def search_encounters(
     search: EncounterSearch = Depends(),
-    authorization: Optional[str] = Header(None)
+    token: str = Depends(require_bearer)
 ):
     """
     Search Encounters (FHIR)
     
     Search for encounter/visit resources.
     """
-    token = await get_access_token(authorization)
-    if not token:
-        raise HTTPException(status_code=401, detail="Authorization header with Bearer token required")
-    
-    params = {k: v for k, v in search.model_dump(by_alias=True).items() if v is not None}
+    params = search_params(search)
     return await make_openemr_request("GET", "/fhir/Encounter", token=token, params=params)
 
 
-@app.get("/fhir/MedicationRequest")
+@fhir_router.get("/MedicationRequest")
+@cached("/fhir/MedicationRequest", ttl=60)
 async def search_medication_requests(
     patient: Optional[str] = Query(None),
     status: Optional[str] = Query(None),
     _count: Optional[int] = Query(10),
-    authorization: Optional[str] = Header(None)
+    token: str = Depends(require_bearer)
 ):
     """
     Search Medication Requests (FHIR)
     
     Search for medication prescription/order resources.
     """
-    token = await get_access_token(authorization)
-    if not token:
-        raise HTTPException(status_code=401, detail="Authorization header with Bearer token required")
-    
-    params = {k: v for k, v in locals().items() if v is not None and k != "authorization" and k != "token"}
+    params = drop_none(patient=patient, status=status, _count=_count)
     return await make_openemr_request("GET", "/fhir/MedicationRequest", token=token, params=params)
 
 
-@app.get("/fhir/Condition")
+@fhir_router.get("/Condition")
+@cached("/fhir/Condition", ttl=300)
 async def search_conditions(
     patient: Optional[str] = Query(None),
     category: Optional[str] = Query(None),
     _count: Optional[int] = Query(10),
-    authorization: Optional[str] = Header(None)
+    token: str = Depends(require_bearer)
 ):
     """
     Search Conditions (FHIR)
     
     Search for condition/problem resources.
     """
-    token = await get_access_token(authorization)
-    if not token:
-        raise HTTPException(status_code=401, detail="Authorization header with Bearer token required")
-    
-    params = {k: v for k, v in locals().items() if v is not None and k != "authorization" and k != "token"}
+    params = drop_none(patient=patient, category=category, _count=_count)
     return await make_openemr_request("GET", "/fhir/Condition", token=token, params=params)
 
 
-@app.get("/fhir/Procedure")
+@fhir_router.get("/Procedure")
+@cached("/fhir/Procedure", ttl=300)
 async def search_procedures(
     patient: Optional[str] = Query(None),
     date: Optional[str] = Query(None),
     _count: Optional[int] = Query(10),
-    authorization: Optional[str] = Header(None)
+    token: str = Depends(require_bearer)
 ):
     """
     Search Procedures (FHIR)
     
     Search for procedure resources.
     """
-    token = await get_access_token(authorization)
-    if not token:
-        raise HTTPException(status_code=401, detail="Authorization header with Bearer token required")
-    
-    params = {k: v for k, v in locals().items() if v is not None and k != "authorization" and k != "token"}
+    params = drop_none(patient=patient, date=date, _count=_count)
     return await make_openemr_request("GET", "/fhir/Procedure", token=token, params=params)
 
 
-@app.get("/fhir/Appointment")
+@fhir_router.get("/Appointment")
+@cached("/fhir/Appointment", ttl=30)
 async def search_appointments(
     patient: Optional[str] = Query(None),
     date: Optional[str] = Query(None),
     status: Optional[str] = Query(None),
     _count: Optional[int] = Query(10),
-    authorization: Optional[str] = Header(None)
+    token: str = Depends(require_bearer)
 ):
     """
     Search Appointments (FHIR)
     
     Search for appointment resources.
     """
-    token = await get_access_token(authorization)
-    if not token:
-        raise HTTPException(status_code=401, detail="Authorization header with Bearer token required")
-    
-    params = {k: v for k, v in locals().items() if v is not None and k != "authorization" and k != "token"}
+    params = drop_none(patient=patient, date=date, status=status, _count=_count)
     return await make_openemr_request("GET", "/fhir/Appointment", token=token, params=params)
 
 
-@app.get("/fhir/DocumentReference/$docref")
+@fhir_router.get("/DocumentReference/$docref")
 async def generate_document(
     patient: Optional[str] = Query(None),
     start: Optional[str] = Query(None),
     end: Optional[str] = Query(None),
-    authorization: Optional[str] = Header(None)
+    token: str = Depends(require_bearer),
+    validators: Optional[Dict[str, str]] = Depends(revalidation_headers)
 ):
     """
     Generate Clinical Document (FHIR)
     
     Generates a Clinical Summary of Care Document (CCD) for a patient.
+    The document is streamed through as OpenEMR produces it.
     """
-    token = await get_access_token(authorization)
-    if not token:
-        raise HTTPException(status_code=401, detail="Authorization header with Bearer token required")
+    params = drop_none(patient=patient, start=start, end=end)
+    return await make_openemr_request(
+        "GET", "/fhir/DocumentReference/$docref", token=token, params=params, headers=validators, stream=True
+    )
+
+
+@fhir_router.get("/patient-snapshot")
+async def get_patient_snapshot(
+    patient: str = Query(..., description="Patient reference", examples=["Patient/123"]),
+    resources: str = Query(
+        "Observation,Condition,MedicationRequest",
+        description="Comma-separated resource types to fetch for the patient"
+    ),
+    token: str = Depends(require_bearer)
+):
+    """
+    Get Patient Snapshot (FHIR)
+    
+    Fetch several patient-scoped searches in one call. The searches run
+    concurrently upstream and the result maps each resource type to its Bundle.
+    """
+    resource_types = list(dict.fromkeys(name.strip() for name in resources.split(",") if name.strip()))
+    unsupported = [name for name in resource_types if name not in PATIENT_SNAPSHOT_RESOURCES]
+    if not resource_types or unsupported:
+        raise HTTPException(
+            status_code=400,
+            detail=f"resources must be drawn from: {', '.join(sorted(PATIENT_SNAPSHOT_RESOURCES))}"
+        )
     
-    params = {k: v for k, v in locals().items() if v is not None and k != "authorization" and k != "token"}
-    return await make_openemr_request("GET", "/fhir/DocumentReference/$docref", token=token, params=params)
+    bundles = await asyncio.gather(*(
+        make_openemr_request("GET", f"/fhir/{name}", token=token, params={"patient": patient})
+        for name in resource_types
+    ))
+    return dict(zip(resource_types, bundles))
 
 
 # Standard OpenEMR API Endpoints
-@app.get("/api/patient")
+api_router = APIRouter(prefix="/api", tags=["Standard API"], dependencies=[Depends(require_bearer)])
+
+
+@api_router.get("/patient")
+@cached("/api/patient", ttl=60)
 async def list_patients(
     name: Optional[str] = Query(None),
     dob: Optional[str] = Query(None),
     pid: Optional[str] = Query(None),
-    authorization: Optional[str] = Header(None)
+    token: str = Depends(require_bearer)
 ):
     """
     List Patients (Standard API)
     
     Get a list of patients using the Standard OpenEMR API.
     """
-    token = await get_access_token(authorization)
-    if not token:
-        raise HTTPException(status_code=401, detail="Authorization header with Bearer token required")
-    
-    params = {k: v for k, v in locals().items() if v is not None and k != "authorization" and k != "token"}
+    params = drop_none(name=name, dob=dob, pid=pid)
     return await make_openemr_request("GET", "/api/patient", token=token, params=params)
 
 
-@app.post(
-    "/api/patient",
+@api_router.post(
+    "/patient",
     status_code=status.HTTP_201_CREATED,
-    tags=["Standard API"],
     summary="Create Patient (Standard API)",
     description="""
     Create a new patient using the Standard OpenEMR API format.
@@ -1019,93 +1692,136 @@ async def list_patients(
 )
 async def create_patient_standard(
     patient: PatientCreate,
-    authorization: Optional[str] = Header(None, description="Bearer token for authentication")
+    token: str = Depends(require_bearer)
 ):
     """
     Create Patient (Standard API)
     
     Create a new patient using the Standard OpenEMR API.
     """
-    token = await get_access_token(authorization)
-    if not token:
-        raise HTTPException(status_code=401, detail="Authorization header with Bearer token required")
-    
-    return await make_openemr_request("POST", "/api/patient", token=token, json_data=patient.model_dump())
+    created = await make_openemr_request(
+        "POST", "/api/patient", token=token, content=patient.model_dump_json(exclude_none=True)
+    )
+    await invalidate_cached("/fhir/Patient", "/api/patient")
+    return created
 
 
-@app.get("/api/patient/{pid}")
+@api_router.get("/patient/{pid}")
+@cached("/api/patient", ttl=60)
 async def get_patient_standard(
     pid: str,
-    authorization: Optional[str] = Header(None)
+    token: str = Depends(require_bearer)
 ):
     """
     Get Patient by ID (Standard API)
     
     Get patient details by ID using the Standard OpenEMR API.
     """
-    token = await get_access_token(authorization)
-    if not token:
-        raise HTTPException(status_code=401, detail="Authorization header with Bearer token required")
-    
-    return await make_openemr_request("GET", f"/api/patient/{pid}", token=token)
+    return await make_openemr_request("GET", API_PATIENT_PATH(quote(pid, safe="")), token=token)
 
 
-@app.get("/api/patient/{pid}/encounter")
+@api_router.get("/patient/{pid}/encounter")
+@cached("/api/patient", ttl=60)
 async def get_patient_encounters(
     pid: str,
-    authorization: Optional[str] = Header(None)
+    token: str = Depends(require_bearer)
 ):
     """
     Get Patient Encounters (Standard API)
     
     Get all encounters for a patient using the Standard OpenEMR API.
     """
-    token = await get_access_token(authorization)
-    if not token:
-        raise HTTPException(status_code=401, detail="Authorization header with Bearer token required")
-    
-    return await make_openemr_request("GET", f"/api/patient/{pid}/encounter", token=token)
+    return await make_openemr_request("GET", API_PATIENT_ENCOUNTERS_PATH(quote(pid, safe="")), token=token)
 
 
-@app.get("/api/encounter")
+@api_router.get("/encounter")
+@cached("/api/encounter", ttl=60)
 async def list_encounters(
     pid: Optional[str] = Query(None),
     date: Optional[str] = Query(None),
-    authorization: Optional[str] = Header(None)
+    token: str = Depends(require_bearer)
 ):
     """
     List Encounters (Standard API)
     
     Get a list of encounters using the Standard OpenEMR API.
     """
-    token = await get_access_token(authorization)
-    if not token:
-        raise HTTPException(status_code=401, detail="Authorization header with Bearer token required")
-    
-    params = {k: v for k, v in locals().items() if v is not None and k != "authorization" and k != "token"}
+    params = drop_none(pid=pid, date=date)
     return await make_openemr_request("GET", "/api/encounter", token=token, params=params)
 
 
-@app.get("/api/appointment")
+@api_router.get("/appointment")
+@cached("/api/appointment", ttl=30)
 async def list_appointments(
     pid: Optional[str] = Query(None),
     pc_eid: Optional[str] = Query(None),
     date: Optional[str] = Query(None),
-    authorization: Optional[str] = Header(None)
+    token: str = Depends(require_bearer)
 ):
     """
     List Appointments (Standard API)
     
     Get a list of appointments using the Standard OpenEMR API.
     """
-    token = await get_access_token(authorization)
-    if not token:
-        raise HTTPException(status_code=401, detail="Authorization header with Bearer token required")
-    
-    params = {k: v for k, v in locals().items() if v is not None and k != "authorization" and k != "token"}
+    params = drop_none(pid=pid, pc_eid=pc_eid, date=date)
     return await make_openemr_request("GET", "/api/appointment", token=token, params=params)
 
 
+# Admin Endpoints
+admin_router = APIRouter(prefix="/admin", tags=["Admin"], dependencies=[Depends(require_admin)])
+
+
+@admin_router.patch("/concurrency")
+async def update_concurrency(update: ConcurrencyUpdate):
+    """
+    Update Upstream Concurrency
+    
+    Change the ceiling on in-flight OpenEMR requests without a restart.
+    Requests waiting for a slot are admitted immediately when it is raised.
+    """
+    limiter: AIMDLimiter = app.state.limiter
+    await limiter.set_max_limit(update.max_concurrent)
+    return {
+        "max_concurrent": limiter.max_limit,
+        "limit": app.state.admission.max_concurrent,
+        "active": app.state.admission.active
+    }
+
+
+
+app.include_router(fhir_router)
+app.include_router(api_router)
+app.include_router(admin_router)
+
+
+def openapi_with_bearer_auth() -> Dict[str, Any]:
+    """Build the schema once, declaring bearer auth on the routes guarded by require_bearer"""
+    if app.openapi_schema is None:
+        schema = FastAPI.openapi(app)
+        # require_bearer reads the token from request state, so FastAPI cannot infer the scheme
+        schema.setdefault("components", {})["securitySchemes"] = {
+            "bearerAuth": {"type": "http", "scheme": "bearer"}
+        }
+        for route in app.routes:
+            if isinstance(route, APIRoute) and any(d.dependency is require_bearer for d in route.dependencies):
+                for method in route.methods:
+                    schema["paths"][route.path_format][method.lower()]["security"] = [{"bearerAuth": []}]
+    return app.openapi_schema
+
+
+app.openapi = openapi_with_bearer_auth
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Workers need the import string. Each worker has its own connection pool and upstream
+    # limits, so OPENEMR_MAX_CONCURRENCY and OPENEMR_RPM_LIMIT apply per worker.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        loop="auto",
+        http="httptools",
+        backlog=2048,
+        log_level="info"
+    )
@@ -11,5 +11,7 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=True,  # Auto-reload on code changes
+        loop="auto",  # uvloop when installed (uvicorn[standard], not on Windows), else asyncio
+        http="httptools",
         log_level="info"
     )
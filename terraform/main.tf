@@ -46,6 +46,7 @@ resource "aws_lambda_function" "api" {
       OPENEMR_CLIENT_ID    = var.openemr_client_id
       OPENEMR_CLIENT_SECRET = var.openemr_client_secret
       OPENEMR_REDIRECT_URI = var.openemr_redirect_uri != "" ? var.openemr_redirect_uri : "https://${aws_apigatewayv2_api.main.id}.execute-api.${var.aws_region}.amazonaws.com/oauth/callback"
+      CORS_ORIGINS         = var.cors_origins
     }
   }
 }
@@ -33,6 +33,11 @@ variable "openemr_redirect_uri" {
   default     = ""
 }
 
+variable "cors_origins" {
+  description = "Comma-separated browser origins allowed by CORS (e.g. https://app.example.com)"
+  type        = string
+}
+
 variable "lambda_memory_size" {
   description = "Lambda function memory size in MB"
   type        = number
@@ -0,0 +1,61 @@
+"""
+Test suite for GET methods in main.py that build upstream paths or cache locally
+
+Run with: pytest test_get_methods.py -v
+"""
+
+import httpx
+import pytest
+from main import app
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Answer every OpenEMR call with an empty Bundle and record the requests made"""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"resourceType": "Bundle", "total": 0})
+
+    monkeypatch.setattr(app.state, "http", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return requests
+
+
+class TestGetMethods:
+    """Test GET endpoints against a MockTransport OpenEMR"""
+
+    # ============================================
+    # Test ids in upstream paths
+    # ============================================
+    
+    @pytest.mark.parametrize("endpoint, upstream_path", [
+        ("/fhir/Patient/1%3Fx%3D1", b"/apis/default/fhir/Patient/1%3Fx%3D1"),
+        ("/api/patient/1%3Fx%3D1", b"/apis/default/api/patient/1%3Fx%3D1"),
+        ("/api/patient/1%3Fx%3D1/encounter", b"/apis/default/api/patient/1%3Fx%3D1/encounter"),
+    ], ids=["fhir-patient", "api-patient", "api-encounters"])
+    def test_id_stays_one_path_segment(self, client, upstream, endpoint, upstream_path):
+        """Reserved characters in an id are percent-encoded rather than injected into the upstream URL"""
+        response = client.get(endpoint, headers={"Authorization": "Bearer test_token_123"})
+        
+        assert response.status_code == 200
+        assert len(upstream) == 1
+        assert upstream[0].url.raw_path == upstream_path
+        assert upstream[0].url.query == b""
+
+    # ============================================
+    # Test GET /fhir/metadata
+    # ============================================
+    
+    def test_metadata_is_served_from_cache(self, client, upstream):
+        """A second CapabilityStatement request does not reach OpenEMR"""
+        first = client.get("/fhir/metadata")
+        second = client.get("/fhir/metadata")
+        
+        assert first.status_code == second.status_code == 200
+        assert second.json() == first.json()
+        assert len(upstream) == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,83 @@
+"""
+Tests for the /fhir/patient-snapshot fan-out endpoint in main.py
+
+Run with: pytest test_patient_snapshot.py -v
+"""
+
+import pytest
+
+
+AUTH = {"Authorization": "Bearer test_token_123"}
+
+
+class TestPatientSnapshot:
+    """Test combining several patient-scoped FHIR searches into one response"""
+
+    def test_result_is_keyed_by_resource_type(self, client, stub_openemr):
+        """Each requested type maps to the Bundle OpenEMR returned for it"""
+        stub_openemr["by_endpoint"] = {
+            "/fhir/Observation": {"resourceType": "Bundle", "total": 2},
+            "/fhir/Condition": {"resourceType": "Bundle", "total": 1}
+        }
+        
+        response = client.get(
+            "/fhir/patient-snapshot",
+            params={"patient": "Patient/123", "resources": "Observation,Condition"},
+            headers=AUTH
+        )
+        
+        assert response.status_code == 200
+        assert response.json() == {
+            "Observation": {"resourceType": "Bundle", "total": 2},
+            "Condition": {"resourceType": "Bundle", "total": 1}
+        }
+
+    def test_one_upstream_search_per_type(self, client, stub_openemr):
+        """Every type is searched once, scoped to the patient"""
+        stub_openemr["ret"] = {"resourceType": "Bundle", "total": 0}
+        
+        client.get(
+            "/fhir/patient-snapshot",
+            params={"patient": "Patient/123", "resources": "Observation,Encounter,Procedure"},
+            headers=AUTH
+        )
+        
+        calls = stub_openemr["calls"]
+        assert sorted(call["endpoint"] for call in calls) == [
+            "/fhir/Encounter", "/fhir/Observation", "/fhir/Procedure"
+        ]
+        assert all(call["method"] == "GET" for call in calls)
+        assert all(call["params"] == {"patient": "Patient/123"} for call in calls)
+        assert all(call["token"] == "test_token_123" for call in calls)
+
+    def test_resources_are_trimmed_and_deduplicated(self, client, stub_openemr):
+        """Whitespace and repeated types do not cause extra searches"""
+        stub_openemr["ret"] = {"resourceType": "Bundle", "total": 0}
+        
+        response = client.get(
+            "/fhir/patient-snapshot",
+            params={"patient": "Patient/123", "resources": " Condition , Observation,Condition,,"},
+            headers=AUTH
+        )
+        
+        assert response.status_code == 200
+        assert list(response.json()) == ["Condition", "Observation"]
+        assert len(stub_openemr["calls"]) == 2
+
+    @pytest.mark.parametrize("resources", ["Patient", "Observation,Bogus", "", " , "],
+                             ids=["unsupported", "mixed", "empty", "blank"])
+    def test_invalid_resource_list_is_rejected(self, client, stub_openemr, resources):
+        """Unsupported or empty resource lists get a 400 without calling OpenEMR"""
+        response = client.get(
+            "/fhir/patient-snapshot",
+            params={"patient": "Patient/123", "resources": resources},
+            headers=AUTH
+        )
+        
+        assert response.status_code == 400
+        assert "resources must be drawn from" in response.json()["detail"]
+        assert stub_openemr["calls"] == []
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
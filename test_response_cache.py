@@ -0,0 +1,195 @@
+"""
+Tests for the Redis-backed GET response cache in main.py
+
+Run with: pytest test_response_cache.py -v
+"""
+
+import asyncio
+import fnmatch
+import pytest
+from main import app, inflight, single_flight
+
+class FakeRedis:
+    """Minimal in-memory stand-in for the redis.asyncio calls the cache uses"""
+
+    def __init__(self):
+        self.store = {}
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def setex(self, key, ttl, value):
+        self.store[key] = value
+
+    async def scan_iter(self, match):
+        for key in list(self.store):
+            if fnmatch.fnmatchcase(key, match):
+                yield key
+
+    async def unlink(self, *keys):
+        for key in keys:
+            self.store.pop(key, None)
+
+
+class TestResponseCache:
+    """Test caching of idempotent GET endpoints"""
+
+    @pytest.fixture(autouse=True)
+    def fake_redis(self, monkeypatch):
+        cache = FakeRedis()
+        monkeypatch.setattr(app.state, "redis", cache)
+        return cache
+
+    def test_second_request_is_served_from_cache(self, client, stub_openemr):
+        """Repeated identical queries hit OpenEMR once"""
+        stub_openemr["ret"] = {"resourceType": "Bundle", "total": 0}
+        headers = {"Authorization": "Bearer test_token_123"}
+
+        first = client.get("/fhir/Condition?patient=123", headers=headers)
+        second = client.get("/fhir/Condition?patient=123", headers=headers)
+
+        assert first.headers["X-Cache"] == "MISS"
+        assert second.headers["X-Cache"] == "HIT"
+        assert second.json() == {"resourceType": "Bundle", "total": 0}
+        assert len(stub_openemr["calls"]) == 1
+
+    def test_cache_is_scoped_to_token(self, client, stub_openemr):
+        """A cached response is never replayed to a different bearer token"""
+        stub_openemr["ret"] = {"data": []}
+
+        client.get("/api/encounter?pid=1", headers={"Authorization": "Bearer token_a"})
+        response = client.get("/api/encounter?pid=1", headers={"Authorization": "Bearer token_b"})
+
+        assert response.headers["X-Cache"] == "MISS"
+        assert len(stub_openemr["calls"]) == 2
+
+    def test_handlers_sharing_a_resource_do_not_collide(self, client, stub_openemr):
+        """Patient details and patient encounters are cached separately"""
+        stub_openemr["by_endpoint"] = {
+            "/api/patient/1": {"data": {"pid": "1"}},
+            "/api/patient/1/encounter": {"data": []}
+        }
+        headers = {"Authorization": "Bearer test_token_123"}
+
+        patient = client.get("/api/patient/1", headers=headers)
+        encounters = client.get("/api/patient/1/encounter", headers=headers)
+
+        assert patient.json() == {"data": {"pid": "1"}}
+        assert encounters.json() == {"data": []}
+
+    def test_patient_create_invalidates_patient_entries(self, client, stub_openemr, fake_redis):
+        """Creating a patient drops cached patient lists but keeps other resources"""
+        stub_openemr["ret"] = {"data": []}
+        headers = {"Authorization": "Bearer test_token_123"}
+        client.get("/api/patient?name=Doe", headers=headers)
+        client.get("/api/appointment?pid=1", headers=headers)
+
+        client.post(
+            "/api/patient",
+            json={"fname": "Jane", "lname": "Doe", "dob": "1990-01-01"},
+            headers=headers
+        )
+
+        assert not any(key.startswith("oemr:/api/patient") for key in fake_redis.store)
+        assert any(key.startswith("oemr:/api/appointment") for key in fake_redis.store)
+
+
+class TestSingleFlight:
+    """Test coalescing of concurrent identical upstream calls"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_callers_share_one_call(self):
+        """Only the first caller runs the upstream call; the rest await its result"""
+        calls = 0
+        release = asyncio.Event()
+
+        async def upstream():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return {"total": 1}
+
+        tasks = [asyncio.create_task(single_flight("key", upstream)) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks)
+
+        assert calls == 1
+        assert results == [{"total": 1}] * 5
+        assert "key" not in inflight
+
+    @pytest.mark.asyncio
+    async def test_failure_propagates_to_followers(self):
+        """Followers see the leader's exception and nothing stays in flight"""
+        release = asyncio.Event()
+
+        async def upstream():
+            await release.wait()
+            raise RuntimeError("upstream down")
+
+        tasks = [asyncio.create_task(single_flight("key", upstream)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert "key" not in inflight
+
+
+class TestConditionalGet:
+    """Test ETag/Cache-Control headers and 304 revalidation on GET endpoints"""
+
+    def test_get_carries_etag_and_cache_control(self, client, stub_openemr):
+        """Successful GETs are tagged for client and proxy revalidation"""
+        stub_openemr["ret"] = {"resourceType": "Bundle", "total": 0}
+        response = client.get("/fhir/Procedure?patient=1", headers={"Authorization": "Bearer test_token_123"})
+
+        assert response.headers["ETag"].startswith('W/"')
+        assert response.headers["Cache-Control"] == "private, max-age=30"
+
+    def test_matching_if_none_match_returns_304(self, client, stub_openemr):
+        """An unchanged body is answered with an empty 304"""
+        stub_openemr["ret"] = {"resourceType": "Bundle", "total": 0}
+        headers = {"Authorization": "Bearer test_token_123"}
+        etag = client.get("/fhir/Procedure?patient=2", headers=headers).headers["ETag"]
+
+        response = client.get("/fhir/Procedure?patient=2", headers={**headers, "If-None-Match": etag})
+
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+
+    def test_changed_body_is_sent_in_full(self, client, stub_openemr):
+        """A stale ETag gets the new body with a new tag"""
+        stub_openemr["ret"] = {"resourceType": "Bundle", "total": 1}
+        response = client.get(
+            "/fhir/Procedure?patient=3",
+            headers={"Authorization": "Bearer test_token_123", "If-None-Match": '"stale"'}
+        )
+
+        assert response.status_code == 200
+        assert response.headers["ETag"] != '"stale"'
+
+    def test_gzipped_body_revalidates_across_encodings(self, client, stub_openemr):
+        """Bundles large enough to be gzipped keep one tag for every content coding"""
+        stub_openemr["ret"] = {
+            "resourceType": "Bundle",
+            "entry": [{"resource": {"resourceType": "Procedure", "id": str(i)}} for i in range(100)]
+        }
+        headers = {"Authorization": "Bearer test_token_123"}
+        first = client.get("/fhir/Procedure?patient=4", headers={**headers, "Accept-Encoding": "gzip"})
+        assert first.headers["Content-Encoding"] == "gzip"
+
+        response = client.get(
+            "/fhir/Procedure?patient=4",
+            headers={**headers, "Accept-Encoding": "identity", "If-None-Match": first.headers["ETag"]}
+        )
+
+        assert response.status_code == 304
+
+    def test_errors_are_not_tagged(self, client):
+        """Only 200 responses get an ETag"""
+        response = client.get("/fhir/Procedure?patient=1")
+
+        assert response.status_code == 401
+        assert "ETag" not in response.headers
@@ -0,0 +1,397 @@
+"""
+Tests for the upstream OpenEMR concurrency and rate controls in main.py
+
+Run with: pytest test_upstream_limits.py -v
+"""
+
+import asyncio
+import time
+import httpx
+import pytest
+from unittest.mock import patch
+from main import (
+    app,
+    AdmissionController,
+    AIMDLimiter,
+    SlidingWindowLimiter,
+    note_rate_limit_headers,
+    parse_retry_after,
+    rate_limit_key
+)
+
+
+class TestAIMDLimiter:
+    """Test the adaptive concurrency limit applied to OpenEMR requests"""
+
+    @pytest.mark.asyncio
+    async def test_grows_while_latency_within_target(self):
+        """Fast responses raise the limit additively"""
+        limiter = AIMDLimiter(initial_limit=4, max_limit=8, latency_target=1.0)
+        for _ in range(20):
+            await limiter.observe(0.1, 200)
+        assert 4 < limiter.limit <= 8
+
+    @pytest.mark.asyncio
+    async def test_never_exceeds_max_limit(self):
+        """The limit is capped at max_limit"""
+        limiter = AIMDLimiter(initial_limit=8, max_limit=8, latency_target=1.0)
+        for _ in range(100):
+            await limiter.observe(0.1, 200)
+        assert limiter.limit == 8
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("status_code", [429, 502, 503])
+    async def test_overload_status_halves_limit(self, status_code):
+        """Overload responses cut the limit multiplicatively"""
+        limiter = AIMDLimiter(initial_limit=8, max_limit=16)
+        await limiter.observe(0.1, status_code)
+        assert limiter.limit == 4
+
+    @pytest.mark.asyncio
+    async def test_slow_responses_shrink_limit(self):
+        """Mean latency above target shrinks the limit"""
+        limiter = AIMDLimiter(initial_limit=8, max_limit=16, latency_target=0.5)
+        await limiter.observe(2.0, 200)
+        assert limiter.limit == 4
+
+    @pytest.mark.asyncio
+    async def test_concurrent_slow_completions_halve_once(self):
+        """Slow responses that were all in flight together count as one congestion event"""
+        limiter = AIMDLimiter(initial_limit=16, max_limit=16, latency_target=1.0)
+        for _ in range(16):
+            await limiter.observe(1.5, 200)
+        assert limiter.limit == 8
+
+    @pytest.mark.asyncio
+    async def test_concurrent_overloads_halve_once(self):
+        """A burst of 503s sent under one limit cuts it only once"""
+        limiter = AIMDLimiter(initial_limit=16, max_limit=16)
+        for _ in range(16):
+            await limiter.observe(0.2, 503)
+        assert limiter.limit == 8
+
+    @pytest.mark.asyncio
+    async def test_calls_sent_after_a_cut_can_cut_again(self):
+        """Congestion that persists under the reduced limit keeps shrinking it"""
+        limiter = AIMDLimiter(initial_limit=16, max_limit=16)
+        await limiter.observe(0.2, 503)
+        await asyncio.sleep(0.01)
+        await limiter.observe(0.001, 503)
+        assert limiter.limit == 4
+
+    @pytest.mark.asyncio
+    async def test_unrecorded_latency_does_not_shrink_limit(self):
+        """Streamed calls report status only, so a long download is not read as congestion"""
+        limiter = AIMDLimiter(initial_limit=8, max_limit=8, latency_target=1.0)
+        await limiter.observe(30.0, 200, record_latency=False)
+        assert limiter.limit == 8
+
+    @pytest.mark.asyncio
+    async def test_never_drops_below_min_limit(self):
+        """Repeated decreases stop at min_limit"""
+        limiter = AIMDLimiter(initial_limit=4, min_limit=1)
+        for _ in range(10):
+            await limiter.decrease()
+        assert limiter.limit == 1
+
+    @pytest.mark.asyncio
+    async def test_slot_enforces_reduced_limit(self):
+        """After a decrease, only the reduced number of slots can be held"""
+        limiter = AIMDLimiter(initial_limit=4, max_limit=4)
+        admission = limiter.admission
+        await limiter.decrease()
+        held = 0
+        release = asyncio.Event()
+
+        async def hold():
+            nonlocal held
+            async with admission:
+                held += 1
+                await release.wait()
+
+        tasks = [asyncio.create_task(hold()) for _ in range(4)]
+        await asyncio.sleep(0)
+        assert held == 2
+        release.set()
+        await asyncio.gather(*tasks)
+        assert held == 4
+
+    @pytest.mark.asyncio
+    async def test_raised_ceiling_follows_saturated_limit(self):
+        """A limit pinned at max_limit moves with a new ceiling"""
+        limiter = AIMDLimiter(initial_limit=8, max_limit=8)
+        await limiter.set_max_limit(32)
+        assert limiter.limit == 32
+        assert limiter.admission.max_concurrent == 32
+
+    @pytest.mark.asyncio
+    async def test_raised_ceiling_admits_waiters(self):
+        """Requests already queued are admitted when the ceiling is raised"""
+        limiter = AIMDLimiter(initial_limit=1, max_limit=1)
+        held = 0
+        release = asyncio.Event()
+
+        async def hold():
+            nonlocal held
+            async with limiter.admission:
+                held += 1
+                await release.wait()
+
+        tasks = [asyncio.create_task(hold()) for _ in range(4)]
+        await asyncio.sleep(0)
+        assert held == 1
+        await limiter.set_max_limit(4)
+        await asyncio.sleep(0)
+        assert held == 4
+        release.set()
+        await asyncio.gather(*tasks)
+
+    @pytest.mark.asyncio
+    async def test_additive_growth_admits_waiters(self):
+        """Growth opens slots for queued requests without waiting for a release"""
+        limiter = AIMDLimiter(initial_limit=2, max_limit=8, latency_target=1.0)
+        held = 0
+        release = asyncio.Event()
+
+        async def hold():
+            nonlocal held
+            async with limiter.admission:
+                held += 1
+                await release.wait()
+
+        tasks = [asyncio.create_task(hold()) for _ in range(6)]
+        await asyncio.sleep(0)
+        assert held == 2
+        while limiter.limit < 4:
+            await limiter.observe(0.1, 200)
+        await asyncio.sleep(0)
+        assert held == 4
+        release.set()
+        await asyncio.gather(*tasks)
+        assert limiter.admission.active == 0
+
+
+class TestAdmissionController:
+    """Test the Condition-based gate on in-flight OpenEMR requests"""
+
+    @pytest.mark.asyncio
+    async def test_resize_admits_waiters(self):
+        """Raising max_concurrent wakes every request waiting for a slot"""
+        admission = AdmissionController(max_concurrent=1)
+        held = 0
+        release = asyncio.Event()
+
+        async def hold():
+            nonlocal held
+            async with admission:
+                held += 1
+                await release.wait()
+
+        tasks = [asyncio.create_task(hold()) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert held == 1
+        await admission.resize(3)
+        await asyncio.sleep(0)
+        assert held == 3
+        release.set()
+        await asyncio.gather(*tasks)
+        assert admission.active == 0
+
+
+class TestAdminConcurrency:
+    """Test the runtime concurrency ceiling exposed at /admin/concurrency"""
+
+    @pytest.fixture(autouse=True)
+    def fresh_limiter(self, monkeypatch):
+        # The app lifespan is session-scoped; keep ceiling changes out of later tests
+        limiter = AIMDLimiter(max_limit=64)
+        monkeypatch.setattr(app.state, "limiter", limiter)
+        monkeypatch.setattr(app.state, "admission", limiter.admission)
+        return limiter
+
+    def test_admin_endpoint_disabled_without_token(self, client):
+        """/admin/concurrency does not exist unless ADMIN_TOKEN is set"""
+        with patch("main.ADMIN_TOKEN", ""):
+            response = client.patch("/admin/concurrency", json={"max_concurrent": 8})
+        assert response.status_code == 404
+
+    def test_admin_endpoint_rejects_wrong_token(self, client):
+        """A mismatched X-Admin-Token is refused"""
+        with patch("main.ADMIN_TOKEN", "s3cret"):
+            response = client.patch(
+                "/admin/concurrency",
+                json={"max_concurrent": 8},
+                headers={"X-Admin-Token": "wrong"}
+            )
+        assert response.status_code == 403
+
+    def test_admin_endpoint_updates_ceiling(self, client, fresh_limiter):
+        """The ceiling is applied to the running limiter"""
+        with patch("main.ADMIN_TOKEN", "s3cret"):
+            response = client.patch(
+                "/admin/concurrency",
+                json={"max_concurrent": 8},
+                headers={"X-Admin-Token": "s3cret"}
+            )
+        assert fresh_limiter.max_limit == 8
+        assert response.status_code == 200
+        assert response.json()["limit"] <= 8
+
+
+class TestStreamedRelay:
+    """Test that streamed upstream bodies hand back their admission slot"""
+
+    def test_streamed_document_releases_slot(self, client, monkeypatch):
+        """The admission slot held for a streamed CCD is returned once the body is relayed"""
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, json={"resourceType": "Bundle"}))
+        monkeypatch.setattr(app.state, "http", httpx.AsyncClient(transport=transport))
+        response = client.get(
+            "/fhir/DocumentReference/$docref",
+            params={"patient": "123"},
+            headers={"Authorization": "Bearer test"}
+        )
+        assert app.state.admission.active == 0
+        assert response.status_code == 200
+        assert response.json() == {"resourceType": "Bundle"}
+
+    def test_streamed_redirect_is_relayed(self, client, monkeypatch):
+        """A non-2xx, non-error upstream status on a streamed call is reported like any other"""
+        async def body():
+            yield b'{"error": "login required"}'
+
+        # An async body is not read eagerly, as with a real network response
+        transport = httpx.MockTransport(
+            lambda request: httpx.Response(302, headers={"Location": "/login"}, content=body())
+        )
+        monkeypatch.setattr(app.state, "http", httpx.AsyncClient(transport=transport))
+        response = client.get("/fhir/Patient", headers={"Authorization": "Bearer test"})
+        assert response.status_code == 302
+        assert response.json()["detail"] == {"error": "login required"}
+        assert app.state.admission.active == 0
+
+
+    def test_streamed_revalidation_skips_upstream_body(self, client, monkeypatch):
+        """If-None-Match reaches OpenEMR, whose 304 is relayed without downloading the bundle"""
+        seen = []
+        body_read = False
+
+        async def body():
+            nonlocal body_read
+            body_read = True
+            yield b'{"resourceType": "Bundle"}'
+
+        def handler(request):
+            seen.append(request.headers.get("if-none-match"))
+            if request.headers.get("if-none-match") == 'W/"v1"':
+                return httpx.Response(304, headers={"ETag": '"v1"'})
+            return httpx.Response(200, headers={"ETag": '"v1"'}, content=body())
+
+        monkeypatch.setattr(app.state, "http", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        response = client.get("/fhir/Patient", headers={"Authorization": "Bearer test", "If-None-Match": 'W/"v1"'})
+        assert response.status_code == 304
+        assert response.headers["ETag"] == 'W/"v1"'
+        assert seen == ['W/"v1"']
+        assert not body_read
+        assert app.state.admission.active == 0
+
+
+class TestUpstreamErrors:
+    """Test how OpenEMR error responses are relayed"""
+
+    def test_html_error_page_is_relayed(self, client, monkeypatch):
+        """A non-JSON error body from a gateway keeps its status instead of becoming a 500"""
+        limiter = AIMDLimiter()
+        monkeypatch.setattr(app.state, "limiter", limiter)
+        monkeypatch.setattr(app.state, "admission", limiter.admission)
+        transport = httpx.MockTransport(lambda request: httpx.Response(
+            502, headers={"Content-Type": "text/html"}, content=b"<html><h1>502 Bad Gateway</h1></html>"
+        ))
+        monkeypatch.setattr(app.state, "http", httpx.AsyncClient(transport=transport))
+        response = client.get("/fhir/Observation", params={"patient": "1"}, headers={"Authorization": "Bearer test"})
+        assert response.status_code == 502
+        assert "502 Bad Gateway" in response.json()["detail"]["error"]
+
+
+class TestRateLimitHeaders:
+    """Test the pause derived from OpenEMR rate-limit response headers"""
+
+    @pytest.fixture(autouse=True)
+    def reset_pause(self):
+        app.state.pause_until = 0.0
+        yield
+        app.state.pause_until = 0.0
+
+    def test_parse_retry_after_seconds(self):
+        """Delta-seconds values are returned as floats"""
+        assert parse_retry_after("5") == 5.0
+
+    def test_parse_retry_after_invalid(self):
+        """Missing or malformed values are ignored"""
+        assert parse_retry_after(None) is None
+        assert parse_retry_after("soon") is None
+
+    def test_429_pauses_for_retry_after(self):
+        """A 429 pauses upstream calls for the Retry-After period"""
+        note_rate_limit_headers(httpx.Response(429, headers={"Retry-After": "10"}))
+        assert 9 < app.state.pause_until - time.monotonic() <= 10
+
+    def test_low_remaining_capacity_pauses(self):
+        """Nearly exhausted capacity pauses before a 429 occurs"""
+        note_rate_limit_headers(httpx.Response(200, headers={
+            "x-ratelimit-remaining-requests": "5",
+            "x-ratelimit-limit-requests": "100",
+            "retry-after": "3"
+        }))
+        assert app.state.pause_until > time.monotonic()
+
+    def test_oauth_calls_honour_rate_limit(self, client, mock_openemr, monkeypatch):
+        """A 429 from the OAuth token endpoint pauses later upstream calls too"""
+        limiter = AIMDLimiter(initial_limit=8, max_limit=8)
+        monkeypatch.setattr(app.state, "limiter", limiter)
+        monkeypatch.setattr(app.state, "admission", limiter.admission)
+        mock_openemr["/token"] = (429, {"error": "slow_down"})
+        response = client.post("/oauth/token", json={"grant_type": "refresh_token", "refresh_token": "r"})
+        assert response.status_code == 429
+        assert app.state.pause_until > time.monotonic()
+        assert limiter.limit == 4
+
+    def test_ample_remaining_capacity_does_not_pause(self):
+        """Plenty of remaining capacity leaves requests unthrottled"""
+        note_rate_limit_headers(httpx.Response(200, headers={
+            "x-ratelimit-remaining-requests": "80",
+            "x-ratelimit-limit-requests": "100"
+        }))
+        assert app.state.pause_until == 0.0
+
+
+class TestSlidingWindowLimiter:
+    """Test the proactive per-resource requests-per-minute window"""
+
+    def test_rate_limit_key_groups_by_resource(self):
+        """Instance paths share their resource type's window"""
+        assert rate_limit_key("/fhir/Patient/123") == "/fhir/Patient"
+        assert rate_limit_key("/api/patient/1/encounter") == "/api/patient"
+        assert rate_limit_key("/fhir/metadata") == "/fhir/metadata"
+
+    @pytest.mark.asyncio
+    async def test_waits_once_window_is_full(self):
+        """Requests beyond the budget wait for the oldest entry to age out"""
+        limiter = SlidingWindowLimiter(requests_per_minute=2, period=0.2)
+        started = time.monotonic()
+        for _ in range(3):
+            await limiter.acquire("/fhir/Patient")
+        assert time.monotonic() - started >= 0.19
+
+    @pytest.mark.asyncio
+    async def test_windows_are_per_key(self):
+        """Different resources do not share a budget"""
+        limiter = SlidingWindowLimiter(requests_per_minute=1, period=60)
+        await asyncio.wait_for(limiter.acquire("/fhir/Patient"), timeout=0.1)
+        await asyncio.wait_for(limiter.acquire("/fhir/Observation"), timeout=0.1)
+
+    @pytest.mark.asyncio
+    async def test_zero_disables_limit(self):
+        """A budget of 0 never throttles"""
+        limiter = SlidingWindowLimiter(requests_per_minute=0)
+        for _ in range(100):
+            await asyncio.wait_for(limiter.acquire("/fhir/Patient"), timeout=0.1)